@@ -1,14 +1,26 @@
 import os
 import sys
+import asyncio
+import weakref
+import hashlib
+import html
 import logging
 import re
-from functools import wraps
-from typing import Dict, List
+from functools import lru_cache, wraps
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Set, Tuple
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from telegram import Update, BotCommand
+from telegram import Message, Update
 from telegram.constants import ChatAction, ParseMode
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from openai import OpenAI
+import httpx
+from openai import (AsyncOpenAI, DefaultAioHttpClient, APIConnectionError,
+                    InternalServerError, RateLimitError)
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from conversation_store import DynamoDBConversationStore, SQLiteConversationStore
+from rate_limiter import AsyncRateLimiter, ChatRateLimiter
 
 # Only load .env file in local development (not in Lambda)
 # Lambda uses environment variables from serverless.yml
@@ -23,26 +35,107 @@ logging.basicConfig(
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
-openai_client = None
+# Resolved once at import instead of on every message
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5-nano")
+MAX_OUTPUT_TOKENS = 5000
+REASONING = {"effort": "low"}
+
+# Minimum seconds between edits while a streamed reply is still arriving
+STREAM_EDIT_INTERVAL = 0.8
+
+# OpenAI errors worth retrying: rate limits, dropped connections and 5xx responses
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+MAX_RETRY_WAIT = 30
+_backoff = wait_random_exponential(min=1, max=MAX_RETRY_WAIT)
+
+# How long to wait for follow-up messages so a burst gets a single reply
+COALESCE_WINDOW = int(os.getenv("COALESCE_MS", "400")) / 1000
+# Each new message restarts the window, but a burst is never held longer than this
+COALESCE_MAX_WAIT = COALESCE_WINDOW * 5
+# Longest text sent to OpenAI in one turn (a coalesced burst of pastes can exceed this)
+MAX_MESSAGE_CHARS = 8000
+
+# Fire-and-forget tasks; the event loop only keeps weak references, so hold them until done
+_background_tasks: Set[asyncio.Task] = set()
+
+# Per-user locks serializing OpenAI turns; entries vanish once no turn holds them
+_user_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# Messages collected during a user's coalescing window ((chat ID, user ID) -> texts);
+# per user, since each user's turns chain off their own conversation
+_pending_messages: Dict[Tuple[int, int], List[str]] = {}
+
+# Messages that arrived while a user's reply was being generated ((chat ID, user ID) ->
+# updates and their texts); they are answered together in one follow-up turn. Per
+# user, so in a group nobody's text lands in someone else's conversation
+_queued_messages: Dict[Tuple[int, int], List[Tuple[Update, str]]] = {}
+BUSY_NOTICE = "Processing, one moment…"
+ERROR_REPLY = "Sorry, I encountered an error. Please try again."
+EMPTY_REPLY = "Sorry, I couldn't come up with an answer. Please try rephrasing."
+
+# Messages answered with a canned reply instead of a model call (only when sent on
+# their own; short replies like "yes" or "why" still go to the model, they have context)
+_HELLO = "Hello! What can I help you with?"
+_THANKS = "You're welcome!"
+_CANNED_REPLIES = {
+    "hi": _HELLO, "hello": _HELLO, "hey": _HELLO,
+    "thanks": _THANKS, "thank you": _THANKS, "thx": _THANKS, "ty": _THANKS,
+    "ok": "👍", "okay": "👍", "👍": "👍"
+}
+
+# Optional semantic cache of replies to opening messages (see create_application)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "").lower() in ("1", "true", "yes")
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Recent /search replies that opened a conversation (query hash -> (response ID, reply)),
+# so repeated searches skip OpenAI. Searches continuing a conversation depend on its
+# history, which is private to that user, so they are never cached
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL_S", "300"))
+_search_cache: TTLCache = TTLCache(maxsize=1024, ttl=SEARCH_CACHE_TTL)
+# Queries whose answer changes minute to minute are never served from the cache
+_TIME_SENSITIVE_RE = re.compile(
+    r'\b(now|today|tonight|currently|latest|live|breaking)\b|\d{1,2}:\d{2}', re.IGNORECASE
+)
 
-# Store conversation IDs per user (Telegram user ID -> OpenAI conversation ID)
-user_conversations: Dict[int, str] = {}
+# Store conversation state per user (Telegram user ID -> ID of the last OpenAI response)
+# Bounded and expiring so old users don't accumulate in long-lived processes,
+# backed by a persistent store so conversations survive restarts. Only used in front
+# of stores private to this process; a shared store is read on every turn
+CONV_TTL = int(os.getenv("CONV_TTL_S", "86400"))
+user_conversations: TTLCache = TTLCache(maxsize=int(os.getenv("MAX_USERS", "10000")), ttl=CONV_TTL)
 
 # Allowed user ID (set via ALLOWED_USER_ID env var)
 ALLOWED_USER_ID = os.getenv("ALLOWED_USER_ID")
 if ALLOWED_USER_ID:
     ALLOWED_USER_ID = int(ALLOWED_USER_ID)
 
+# Proactively pace OpenAI calls to stay under the account's rate limits
+rate_limiter = AsyncRateLimiter(
+    rpm=int(os.getenv("OPENAI_MAX_REQUESTS_PER_MINUTE", "500")),
+    tpm=int(os.getenv("OPENAI_MAX_TOKENS_PER_MINUTE", "200000"))
+)
+# Stay under Telegram's flood limits (about 1 message/s per chat, 30/s overall)
+telegram_limiter = ChatRateLimiter(per_chat=1, overall=25)
+# Cap on replies being generated at once; a retry keeps its slot, so backoff can't overshoot it
+openai_semaphore = asyncio.Semaphore(int(os.getenv("OPENAI_MAX_CONCURRENCY", "20")))
 
-def is_user_allowed(user_id: int) -> bool:
-    """Check if user is allowed to use the bot."""
-    if ALLOWED_USER_ID is None:
+
+# The auth check is picked once at import, so each message does a single comparison at most
+if ALLOWED_USER_ID is None:
+    def is_user_allowed(user_id: int) -> bool:
+        """Check if user is allowed to use the bot."""
         return True  # If not set, allow everyone (for development)
-    return user_id == ALLOWED_USER_ID
+else:
+    def is_user_allowed(user_id: int, _allowed: int = ALLOWED_USER_ID) -> bool:
+        """Check if user is allowed to use the bot."""
+        return user_id == _allowed
 
 
 def require_auth(func):
     """Decorator to check user authorization before executing handler."""
+    if ALLOWED_USER_ID is None:
+        return func  # Everyone is allowed, so skip the wrapper entirely
+    
     @wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not is_user_allowed(update.effective_user.id):
@@ -58,57 +151,234 @@ def split_message(text: str, max_length: int = 4096) -> List[str]:
         return [text]
     
     chunks = []
-    current_chunk = ""
+    # Pieces of the current chunk with their total length (separators included);
+    # joined once per chunk instead of rebuilding a growing string per piece
+    current: List[str] = []
+    current_len = 0
     
     for line in text.split('\n'):
+        line = line.rstrip()
+        line_len = len(line)
         # If line itself is too long, split by words
-        if len(line) > max_length:
+        if line_len > max_length:
             # Save current chunk if exists
-            if current_chunk:
-                chunks.append(current_chunk)
-                current_chunk = ""
+            chunk = "\n".join(current).rstrip()
+            if chunk:
+                chunks.append(chunk)
+            current = []
+            current_len = -1  # The first word has no separator before it
             
-            # Split long line by words
-            for word in line.split(' '):
-                if len(current_chunk) + len(word) + 1 > max_length:
-                    if current_chunk:
-                        chunks.append(current_chunk)
-                    current_chunk = word
+            for word in line.split():
+                word_len = len(word)
+                if current_len + 1 + word_len > max_length:
+                    if current:
+                        chunks.append(" ".join(current))
+                    # A single word longer than the limit is cut at fixed offsets
+                    while word_len > max_length:
+                        chunks.append(word[:max_length])
+                        word = word[max_length:]
+                        word_len -= max_length
+                    current = [word]
+                    current_len = word_len
                 else:
-                    current_chunk = f"{current_chunk} {word}".strip()
+                    current.append(word)
+                    current_len += 1 + word_len
+            
+            # Lines after this one are joined with newlines
+            if current:
+                current = [" ".join(current)]
+        elif not current:
+            # Chunks don't start with blank lines
+            if line_len:
+                current = [line.lstrip()]
+                current_len = len(current[0])
+        elif current_len + 1 + line_len > max_length:
+            chunk = "\n".join(current).rstrip()
+            if chunk:
+                chunks.append(chunk)
+            # Like above, the next chunk doesn't start with a blank line
+            current = [line.lstrip()] if line_len else []
+            current_len = len(current[0]) if current else 0
         else:
-            # Check if adding this line would exceed limit
-            separator = '\n' if current_chunk else ''
-            if len(current_chunk) + len(separator) + len(line) > max_length:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                current_chunk = line
-            else:
-                current_chunk = f"{current_chunk}{separator}{line}".strip()
-    
-    if current_chunk:
-        chunks.append(current_chunk)
+            current.append(line)
+            current_len += 1 + line_len
+    
+    chunk = "\n".join(current).rstrip()
+    if chunk:
+        chunks.append(chunk)
     
     return chunks
 
 
-def clean_response(text: str) -> str:
+# Linear-time matching for the link/URL patterns when google-re2 is installed;
+# they only use features RE2 supports, so the stdlib engine is a drop-in fallback
+try:
+    import re2 as _link_re
+except ImportError:
+    _link_re = re
+
+# Patterns used by clean_response (compiled once, used for every reply)
+_MD_LINK_RE = _link_re.compile(r'\[([^\]]+)\]\([^\)]+\)')
+_URL_RE = _link_re.compile(r'https?://[^\s<\)]+|www\.[^\s<\)]+')
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def clean_response(text: str, log_removed: bool = True) -> str:
     """Minimal processing - remove markdown links and URLs, keep source names."""
+    # Most replies have no links at all; substring checks (much faster than a
+    # regex scan) let those skip each pattern entirely
     # Remove markdown links [text](url) - keep just the text (source name)
-    markdown_links = re.findall(r'\[([^\]]+)\]\([^\)]+\)', text)
-    if markdown_links:
-        logger.info(f"Removed {len(markdown_links)} markdown link(s): {markdown_links}")
-    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
+    if "](" in text:
+        text, link_count = _MD_LINK_RE.subn(r'\1', text)
+        if link_count and log_removed:
+            logger.info("Removed %d markdown link(s)", link_count)
     
     # Remove raw URLs (http://, https://, www.) - but preserve HTML tags
-    urls = re.findall(r'https?://[^\s<\)]+|www\.[^\s<\)]+', text)
-    if urls:
-        logger.info(f"Removed {len(urls)} URL(s): {urls[:3]}{'...' if len(urls) > 3 else ''}")
-    text = re.sub(r'https?://[^\s<\)]+', '', text)
-    text = re.sub(r'www\.[^\s<\)]+', '', text)
+    if "http" in text or "www." in text:
+        text, url_count = _URL_RE.subn('', text)
+        if url_count and log_removed:
+            logger.info("Removed %d URL(s)", url_count)
     
     return text.strip()
 
+# Common HTML tags Telegram doesn't support; they are dropped and their text kept
+_DROPPED_TAGS = frozenset({
+    "p", "div", "br", "hr", "ul", "ol", "li", "h1", "h2", "h3", "h4", "h5", "h6",
+    "table", "thead", "tbody", "tr", "th", "td", "sup", "sub", "small", "mark"
+})
+
+# Dropped tags that end a block of text; a blank line keeps the blocks apart
+_BLOCK_TAGS = frozenset({"p", "div", "br", "li"})
+
+# Tags whose content is shown literally, up to their closing tag
+_LITERAL_TAGS = frozenset({"code", "pre"})
+# A <code> block directly inside <pre>, which Telegram supports for language hints
+_PRE_CODE_RE = re.compile(r'\s*<code(?:\s+class="([^"<>]*)")?\s*>(.*)</code>\s*\Z', re.DOTALL)
+
+# Tags (and their attributes) that Telegram accepts with ParseMode.HTML
+_TELEGRAM_TAGS = {
+    "b": (), "strong": (), "i": (), "em": (), "u": (), "ins": (), "s": (), "strike": (),
+    "del": (), "span": ("class",), "tg-spoiler": (), "code": ("class",), "pre": (),
+    "blockquote": ("expandable",), "a": ("href",)
+}
+
+
+class _TelegramHTMLSanitizer(HTMLParser):
+    """Rebuild HTML using only Telegram-supported tags, with every tag properly closed."""
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.open_tags: List[str] = []
+        # Raw content of the open code/pre tag, escaped when the tag closes
+        self.literal: Optional[List[str]] = None
+    
+    def handle_starttag(self, tag, attrs):
+        allowed = _TELEGRAM_TAGS.get(tag, ())
+        # Bare words as attributes (e.g. "a<b and c>d") mean this isn't really a tag,
+        # unless the tag allows them as flags (e.g. <blockquote expandable>)
+        is_markup = all(value is not None or name in allowed for name, value in attrs)
+        if tag not in _TELEGRAM_TAGS or not is_markup:
+            if tag == "br":
+                self.parts.append("\n")
+            elif tag not in _DROPPED_TAGS:
+                # Not markup at all (e.g. "a<b" in code) - show it literally
+                self.parts.append(html.escape(self.get_starttag_text(), quote=False))
+            return
+        attr_text = "".join(
+            f" {name}" if value is None else f' {name}="{html.escape(value)}"'
+            for name, value in attrs if name in allowed
+        )
+        self.parts.append(f"<{tag}{attr_text}>")
+        self.open_tags.append(tag)
+        if tag in _LITERAL_TAGS:
+            # Everything up to the matching closing tag is text (e.g. "a<b" in code)
+            self.set_cdata_mode(tag)
+            self.literal = []
+    
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing tags like <br/> are treated like their open-tag form
+        self.handle_starttag(tag, attrs)
+        if tag in self.open_tags:
+            self.handle_endtag(tag)
+    
+    def handle_endtag(self, tag):
+        if self.literal is not None:
+            self.flush_literal()
+        if tag in _BLOCK_TAGS:
+            if self.parts and not self.parts[-1].endswith("\n\n"):
+                self.parts.append("\n\n")
+            return
+        if tag not in _TELEGRAM_TAGS and tag not in _DROPPED_TAGS:
+            self.parts.append(html.escape(f"</{tag}>", quote=False))
+            return
+        if tag not in self.open_tags:
+            return  # Closing tag without a matching opening tag, or a dropped one
+        # Close anything opened inside this tag first to keep nesting valid
+        while True:
+            open_tag = self.open_tags.pop()
+            self.parts.append(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+    
+    def handle_data(self, data):
+        if self.literal is not None:
+            self.literal.append(data)
+        else:
+            self.parts.append(html.escape(data, quote=False))
+    
+    def flush_literal(self):
+        """Emit the collected code/pre content as escaped text."""
+        text = "".join(self.literal)
+        self.literal = None
+        # Content isn't entity-decoded in literal mode; decode it so "&lt;" isn't escaped twice
+        match = _PRE_CODE_RE.match(text) if self.open_tags[-1] == "pre" else None
+        if match:
+            language, text = match.groups()
+            attr_text = f' class="{html.escape(language)}"' if language else ""
+            self.parts.append(f"<code{attr_text}>{html.escape(html.unescape(text), quote=False)}</code>")
+        else:
+            self.parts.append(html.escape(html.unescape(text), quote=False))
+    
+    def close(self):
+        super().close()
+        if self.literal is not None:
+            # A code/pre tag left open; the parser keeps its unterminated content buffered
+            self.literal.append(self.rawdata)
+            self.rawdata = ""
+            self.flush_literal()
+        # No separator needed after the last block
+        if self.parts and self.parts[-1] == "\n\n":
+            self.parts.pop()
+        # Auto-close tags left dangling (e.g. a reply cut mid-tag)
+        while self.open_tags:
+            self.parts.append(f"</{self.open_tags.pop()}>")
+
+
+def sanitize_html(text: str) -> str:
+    """Make text safe to send with ParseMode.HTML."""
+    sanitizer = _TelegramHTMLSanitizer()
+    sanitizer.feed(text)
+    sanitizer.close()
+    return "".join(sanitizer.parts)
+
+
+def telegram_payload(text: str) -> Tuple[str, Optional[str]]:
+    """Return the text to send and its parse mode, skipping HTML when there's no markup."""
+    # Most replies have no tags or entities; those go out as plain text, which
+    # skips the sanitizer here and HTML parsing (and any rejection) at Telegram
+    if "<" not in text and "&" not in text:
+        return text, None
+    return sanitize_html(text), ParseMode.HTML
+
+
+def html_to_plain(html_text: str) -> str:
+    """Turn sanitized HTML back into plain text (tags dropped, entities decoded)."""
+    if "<" in html_text:
+        html_text = _HTML_TAG_RE.sub('', html_text)
+    return html.unescape(html_text) if "&" in html_text else html_text
+
+
 SYSTEM_INSTRUCTION = """You are a helpful AI assistant for Telegram.
 
 ABSOLUTE RULES (NEVER BREAK THESE):
@@ -116,6 +386,7 @@ ABSOLUTE RULES (NEVER BREAK THESE):
 2. NEVER use markdown syntax. No **, no *, no `, no #, no ##, no [text](url), no ![image](url). No markdown at all.
 3. Always summarize information in your own words. Do not copy raw output from search results.
 4. NEVER ask for clarification or confirmation. Proceed immediately with the requested action and provide results.
+5. These rules apply to web search answers too: format them with HTML tags and name sources without linking them.
 
 FORMAT RULES:
 - Use ONLY HTML tags for formatting: <b>bold</b>, <i>italic</i>, <code>code</code>
@@ -143,76 +414,339 @@ WRONG source attribution:
 
 Be concise but thorough. Provide complete, helpful answers."""
 
+# Opening input item for every new conversation (built once, shared read-only)
+SYSTEM_MESSAGE_ITEM = {"type": "message", "role": "system", "content": SYSTEM_INSTRUCTION}
+
+# Tool list for /search requests
+WEB_SEARCH_TOOLS = [{"type": "web_search"}]
 
-def get_or_create_conversation(user_id: int) -> str:
-    """Get existing conversation ID or create a new one for the user."""
-    conversation_id = user_conversations.get(user_id)
+
+def get_conversation(store, user_id: int) -> Optional[str]:
+    """Get the user's last response ID, falling back to the persistent store."""
+    if store.shared:
+        # Another container may have answered since; a cached ID would fork the thread
+        return store.get(user_id)
+    
+    response_id = user_conversations.get(user_id)
+    
+    if response_id is None:
+        response_id = store.get(user_id)
+        if response_id is not None:
+            user_conversations[user_id] = response_id
     
-    if conversation_id is None:
-        conversation = openai_client.conversations.create(
-            items=[
+    return response_id
+
+
+def set_conversation(store, user_id: int, response_id: str) -> None:
+    """Record the user's latest response ID in memory and in the persistent store."""
+    if not store.shared:
+        user_conversations[user_id] = response_id
+    store.set(user_id, response_id)
+
+
+def clear_conversation(store, user_id: int) -> bool:
+    """Forget the user's conversation. Returns True if there was one."""
+    in_memory = user_conversations.pop(user_id, None) is not None
+    persisted = store.delete(user_id)
+    return in_memory or persisted
+
+
+def search_cache_key(query: str) -> Optional[bytes]:
+    """Key a /search query for _search_cache, or None if it shouldn't be cached."""
+    if not SEARCH_CACHE_TTL or _TIME_SENSITIVE_RE.search(query):
+        return None
+    # The model is part of the key so switching OPENAI_MODEL doesn't serve stale replies
+    return hashlib.blake2b(f"{OPENAI_MODEL}\0{query}".encode(), digest_size=16).digest()
+
+
+def get_user_lock(user_id: int) -> asyncio.Lock:
+    """Get the lock that serializes a user's turns, creating it if needed."""
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = _user_locks[user_id] = asyncio.Lock()
+    return lock
+
+
+def conversation_params(previous_response_id: Optional[str], message: str) -> dict:
+    """Build the input for the user's next turn, continuing their conversation if any."""
+    if previous_response_id is None:
+        # New conversation: the system instruction goes in with the first turn and is
+        # carried forward by previous_response_id, so no separate setup call is needed
+        return {
+            "input": [
+                SYSTEM_MESSAGE_ITEM,
                 {
                     "type": "message",
-                    "role": "system",
-                    "content": SYSTEM_INSTRUCTION
+                    "role": "user",
+                    "content": message
                 }
             ]
-        )
-        conversation_id = conversation.id
-        user_conversations[user_id] = conversation_id
+        }
     
-    return conversation_id
+    return {"input": message, "previous_response_id": previous_response_id}
+
+
+def wait_retry_after(retry_state) -> float:
+    """Wait as long as the server's Retry-After asks, else back off exponentially with jitter."""
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    if response is not None:
+        try:
+            return min(float(response.headers.get("retry-after", "")), MAX_RETRY_WAIT)
+        except ValueError:
+            pass
+    return _backoff(retry_state)
+
+
+def log_task_error(task: asyncio.Task) -> None:
+    """Log the exception of a finished background task, if any."""
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background task failed: %s", task.exception())
+
+
+def run_in_background(coro) -> asyncio.Task:
+    """Schedule a coroutine without awaiting it; failures are logged, never raised."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(log_task_error)
+    return task
+
+
+async def send_html(send, text: str, chat_id: int) -> None:
+    """Send text with HTML formatting, sanitized so Telegram accepts it on the first try."""
+    await telegram_limiter.acquire(chat_id)
+    body, parse_mode = telegram_payload(text)
+    try:
+        await send(body, parse_mode=parse_mode)
+    except BadRequest as e:
+        if parse_mode is None:
+            raise
+        # Telegram still rejected the markup; better to lose formatting than the reply
+        logger.warning("HTML rejected, sending plain text: %s", e)
+        await send(html_to_plain(body))
+
+
+async def replace_placeholder(placeholder: Message, text: str, chat_id: int) -> None:
+    """Overwrite the streaming placeholder with a plain notice."""
+    await telegram_limiter.acquire(chat_id)
+    try:
+        await placeholder.edit_text(text)
+    except TelegramError as e:
+        logger.warning("Could not update placeholder: %s", e)
+
+
+async def stream_reply(client: AsyncOpenAI, update: Update,
+                       api_params: dict) -> Tuple[Optional[str], str]:
+    """Stream a response from OpenAI, editing a placeholder message as text arrives.
+    
+    Returns the response ID and the cleaned response text that was sent. The text is
+    empty when there was nothing to send; the placeholder then says why instead.
+    """
+    loop = asyncio.get_running_loop()
+    chat_id = update.effective_chat.id
+    await telegram_limiter.acquire(chat_id)
+    placeholder = await update.message.reply_text("…")
+    shown = ""
+    
+    # Transient failures restart the stream; the placeholder is reused across attempts.
+    # The SDK's own retries are off for this call only; other calls keep them
+    client = client.with_options(max_retries=0)
+    try:
+        async for attempt in AsyncRetrying(
+            retry=retry_if_exception_type(RETRYABLE_ERRORS),
+            wait=wait_retry_after,
+            stop=stop_after_attempt(5),
+            reraise=True
+        ):
+            with attempt:
+                parts: List[str] = []
+                last_edit = loop.time()
+                async with client.responses.stream(**api_params) as stream:
+                    async for event in stream:
+                        if event.type != "response.output_text.delta":
+                            continue
+                        parts.append(event.delta)
+                        if loop.time() - last_edit < STREAM_EDIT_INTERVAL:
+                            continue
+                        
+                        preview = clean_response("".join(parts), log_removed=False)[:4096]
+                        # Previews are optional, so one is skipped rather than waited for
+                        if preview and preview != shown and telegram_limiter.try_acquire(chat_id):
+                            try:
+                                body, parse_mode = telegram_payload(preview)
+                                await placeholder.edit_text(body, parse_mode=parse_mode)
+                                shown = preview
+                            except TelegramError as e:
+                                # A failed preview edit is harmless; a later edit will catch up
+                                logger.debug("Skipping partial edit: %s", e)
+                        last_edit = loop.time()
+                    response = await stream.get_final_response()
+    except Exception as e:
+        # Don't leave a partial preview that looks like a finished answer
+        logger.error("Error calling OpenAI: %s", e)
+        await replace_placeholder(placeholder, ERROR_REPLY, chat_id)
+        return None, ""
+    
+    # Clean URLs and markdown from response
+    response_text = clean_response(response.output_text)
+    if not response_text:
+        logger.warning("Empty response %s", response.id)
+        await replace_placeholder(placeholder, EMPTY_REPLY, chat_id)
+        return response.id, ""
+    
+    # Split message if too long (Telegram limit is 4096 characters)
+    chunks = split_message(response_text)
+    
+    # The first chunk replaces the placeholder, the rest are sent as new messages
+    for i, chunk in enumerate(chunks):
+        if i == 0 and chunk == shown:
+            continue
+        send = placeholder.edit_text if i == 0 else update.message.reply_text
+        await send_html(send, chunk, chat_id)
+    
+    return response.id, response_text
 
 
 async def send_to_openai(update: Update, context: ContextTypes.DEFAULT_TYPE, 
-                         message: str, use_web_search: bool = False):
-    """Send message to OpenAI and reply with the response."""
+                         message: str, use_web_search: bool = False,
+                         search_key: Optional[bytes] = None):
+    """Send message to OpenAI and reply with the response.
+    
+    If search_key is given and the user has no conversation yet, the reply is
+    looked up in and stored to _search_cache under it.
+    """
     user_id = update.effective_user.id
+    # Shared objects set up by create_application, bound to locals once per message
+    client = context.bot_data["openai"]
+    store = context.bot_data["conversations"]
+    semantic_cache = context.bot_data["semantic_cache"]
     
-    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
+    # The typing indicator is cosmetic; send it alongside the OpenAI call instead of before it
+    run_in_background(
+        context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
+    )
     
     try:
-        conversation_id = get_or_create_conversation(user_id)
-        
-        api_params = {
-            "model": os.getenv("OPENAI_MODEL", "gpt-5-nano"),
-            "input": message,
-            "max_output_tokens": 5000,
-            "conversation": conversation_id,
-            "reasoning": {"effort": "low"}
-        }
-        
-        if use_web_search:
-            api_params["tools"] = [{"type": "web_search"}]
+        # One turn per user at a time, so each chains off the previous reply
+        async with get_user_lock(user_id):
+            # Opening messages don't depend on earlier context, so similar ones can share a reply
+            previous_response_id = get_conversation(store, user_id)
+            embedding = None
+            if search_key is not None and previous_response_id is None:
+                cached = _search_cache.get(search_key)
+                if cached is not None:
+                    logger.info("Search cache hit")
+                    response_id, response_text = cached
+                    for chunk in split_message(response_text):
+                        await send_html(update.message.reply_text, chunk, update.effective_chat.id)
+                    # Continue from the cached turn so follow-ups keep the search context
+                    set_conversation(store, user_id, response_id)
+                    return
+            
+            if semantic_cache is not None and not use_web_search and previous_response_id is None:
+                try:
+                    result = await client.embeddings.create(model=EMBEDDING_MODEL, input=message)
+                    embedding = result.data[0].embedding
+                except Exception as e:
+                    # The cache is only an optimization; answer from the model instead
+                    logger.warning("Semantic cache lookup failed: %s", e)
+                cached = semantic_cache.lookup(embedding) if embedding is not None else None
+                if cached is not None:
+                    logger.info("Semantic cache hit")
+                    response_id, response_text = cached
+                    for chunk in split_message(response_text):
+                        await send_html(update.message.reply_text, chunk, update.effective_chat.id)
+                    # Continue from the cached turn, so the next message has its context
+                    set_conversation(store, user_id, response_id)
+                    return
         
-        response = openai_client.responses.create(**api_params)
-        response_text = response.output_text
+            api_params = {
+                "model": OPENAI_MODEL,
+                **conversation_params(previous_response_id, message),
+                "max_output_tokens": MAX_OUTPUT_TOKENS,
+                # Drop the oldest turns instead of failing once history outgrows the context
+                "truncation": "auto",
+                "reasoning": REASONING
+            }
         
-        # Clean URLs and markdown from response
-        response_text = clean_response(response_text)
+            if use_web_search:
+                api_params["tools"] = WEB_SEARCH_TOOLS
+                # /search always wants a search; don't let the model answer from memory
+                api_params["tool_choice"] = "required"
         
-        # Split message if too long (Telegram limit is 4096 characters)
-        chunks = split_message(response_text)
+            # Rough estimate: ~4 characters per input token plus room for the reply
+            await rate_limiter.acquire(len(message) // 4 + 500)
+            async with openai_semaphore:
+                response_id, response_text = await stream_reply(client, update, api_params)
+            if not response_text:
+                # The placeholder already says what went wrong; keep the earlier history
+                return
+            set_conversation(store, user_id, response_id)
         
-        # Send each chunk
-        for chunk in chunks:
-            # Try HTML first, fall back to plain text if it fails
-            try:
-                await update.message.reply_text(chunk, parse_mode=ParseMode.HTML)
-            except Exception as e:
-                logger.warning(f"HTML parsing failed, falling back to plain text: {e}")
-                # Strip all HTML tags for plain text fallback
-                plain_text = re.sub(r'<[^>]+>', '', chunk)
-                await update.message.reply_text(plain_text)
+            if embedding is not None:
+                semantic_cache.add(embedding, response_id, response_text)
+            if search_key is not None and previous_response_id is None:
+                _search_cache[search_key] = (response_id, response_text)
     except Exception as e:
-        logger.error(f"Error calling OpenAI: {e}")
-        await update.message.reply_text("Sorry, I encountered an error. Please try again.")
+        logger.error("Error calling OpenAI: %s", e)
+        await update.message.reply_text(ERROR_REPLY)
 
 
 @require_auth
 async def chat_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages by sending them to ChatGPT."""
-    await send_to_openai(update, context, update.message.text)
+    text = (update.message.text or "").strip()
+    if not text:
+        return  # Nothing worth a model call
+    
+    chat_id = update.effective_chat.id
+    key = (chat_id, update.effective_user.id)
+    pending = _pending_messages.get(key)
+    if pending is not None:
+        # Another handler is collecting this burst and will send our text with it
+        pending.append(text)
+        return
+    
+    queued = _queued_messages.get(key)
+    if queued is not None:
+        # A reply is in progress; its handler answers this next, with anything else queued
+        queued.append((update, text))
+        if len(queued) == 1:
+            await telegram_limiter.acquire(chat_id)
+            await update.message.reply_text(BUSY_NOTICE)
+        return
+    
+    pending = _pending_messages[key] = [text]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + COALESCE_MAX_WAIT
+    seen = 0
+    try:
+        # Wait until the user has been quiet for a full window
+        while COALESCE_WINDOW and len(pending) != seen and loop.time() < deadline:
+            seen = len(pending)
+            await asyncio.sleep(min(COALESCE_WINDOW, deadline - loop.time()))
+    finally:
+        del _pending_messages[key]
+    
+    message = "\n\n".join(pending)
+    canned = _CANNED_REPLIES.get(message.lower().rstrip("!. "))
+    if canned is not None:
+        await telegram_limiter.acquire(chat_id)
+        await update.message.reply_text(canned)
+        return
+    
+    _queued_messages[key] = []
+    try:
+        while message:
+            await send_to_openai(update, context, message[:MAX_MESSAGE_CHARS])
+            queued = _queued_messages[key]
+            _queued_messages[key] = []
+            if queued:
+                # Reply to the latest queued message, so the answer quotes what it responds to
+                update = queued[-1][0]
+            message = "\n\n".join(text for _, text in queued)
+    finally:
+        del _queued_messages[key]
 
 
 @require_auth
@@ -231,8 +765,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def newchat_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /newchat command - clears conversation history."""
     user_id = update.effective_user.id
-    if user_id in user_conversations:
-        del user_conversations[user_id]
+    if clear_conversation(context.bot_data["conversations"], user_id):
         await update.message.reply_text("Conversation cleared! Starting fresh.")
     else:
         await update.message.reply_text("No conversation to clear. Send me a message to start!")
@@ -247,14 +780,33 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Usage: /search [your query]\nExample: /search weather in NYC")
         return
     
-    search_prompt = f"{query}\n\nIMPORTANT: Use HTML formatting (<b>, <i>, <code>) for structure. You may mention source names (e.g., 'nytimes', 'reddit') but NEVER include URLs, links, or markdown syntax. Rewrite all information in your own words using HTML tags for formatting."
-    await send_to_openai(update, context, search_prompt, use_web_search=True)
+    # Formatting rules for search answers live in SYSTEM_INSTRUCTION, so only the query is sent
+    await send_to_openai(update, context, query, use_web_search=True, search_key=search_cache_key(query))
+
+
+@lru_cache(maxsize=None)
+def _get_client(api_key: str) -> AsyncOpenAI:
+    """Get the shared OpenAI client for an API key, creating it on first use.
+    
+    Module state survives Lambda warm starts, so the client and its connection
+    pool are reused across invocations.
+    """
+    # aiohttp-backed pool; httpx's own async transport loses throughput badly
+    # under many concurrent requests. Idle connections are kept for 5 minutes
+    # (the default is 5 seconds) so a user's next message skips the TLS handshake
+    http_client = DefaultAioHttpClient(
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=300),
+        timeout=httpx.Timeout(30.0, connect=5.0)
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client)
 
 
 def create_application():
-    """Create and configure the bot application."""
-    global openai_client
+    """Create and configure the bot application.
     
+    The OpenAI client, conversation store and semantic cache are kept in
+    bot_data, where handlers reach them through context.bot_data.
+    """
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not token:
         raise ValueError("TELEGRAM_BOT_TOKEN not found in environment variables!")
@@ -263,18 +815,40 @@ def create_application():
     if not api_key:
         raise ValueError("OPENAI_API_KEY not found in environment variables!")
 
-    openai_client = OpenAI(api_key=api_key)
+    on_lambda = bool(os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+    table_name = os.getenv("DYNAMODB_TABLE_NAME")
+    if table_name:
+        # Shared by all containers, so conversations survive cold starts and scale-out
+        conversation_store = DynamoDBConversationStore(table_name, ttl=CONV_TTL)
+    else:
+        # Lambda can only write to /tmp, which lasts as long as the container
+        default_db_path = "/tmp/conversations.db" if on_lambda else "conversations.db"
+        conversation_store = SQLiteConversationStore(
+            os.getenv("CONVERSATION_DB_PATH", default_db_path), ttl=CONV_TTL
+        )
+    
+    semantic_cache = None
+    if SEMANTIC_CACHE_ENABLED:
+        # Imported here so numpy is only loaded when the cache is turned on
+        from semantic_cache import SemanticCache
+        default_path = "/tmp/semantic_cache.db" if on_lambda else "semantic_cache.db"
+        semantic_cache = SemanticCache(
+            os.getenv("SEMANTIC_CACHE_PATH", default_path),
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+        )
     application = Application.builder().token(token).build()
-
-    # Set bot commands (shows up when user types "/")
-    async def post_init(app: Application) -> None:
-        await app.bot.set_my_commands([
-            BotCommand("start", "Show welcome message and commands"),
-            BotCommand("newchat", "Start a new conversation"),
-            BotCommand("search", "Search the web for information")
-        ])
+    application.bot_data["openai"] = _get_client(api_key)
+    application.bot_data["conversations"] = conversation_store
+    application.bot_data["semantic_cache"] = semantic_cache
+
+    # The "/" command menu (bot_commands.json) is registered at deploy time by deploy.sh,
+    # not here: it never changes between cold starts
+    async def post_shutdown(app: Application) -> None:
+        await app.bot_data["openai"].close()
+        _get_client.cache_clear()
     
-    application.post_init = post_init
+    application.post_shutdown = post_shutdown
 
     # Command handlers
     application.add_handler(CommandHandler("start", start_command))
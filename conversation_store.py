@@ -0,0 +1,92 @@
+"""
+Persistent storage for per-user conversation state
+"""
+import sqlite3
+import time
+from typing import Optional
+
+
+class SQLiteConversationStore:
+    """Map Telegram user IDs to their last OpenAI response ID in SQLite (WAL mode)."""
+
+    # Private to this process, so reads can be served from an in-memory cache
+    shared = False
+
+    def __init__(self, path: str, ttl: int):
+        self.ttl = ttl
+        # Autocommit: each statement is its own transaction, WAL keeps writes cheap
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations "
+            "(user_id INTEGER PRIMARY KEY, response_id TEXT NOT NULL, ts INTEGER NOT NULL)"
+        )
+        # Expired rows are never read again; drop them so the table stays bounded
+        self.prune()
+
+    def get(self, user_id: int) -> Optional[str]:
+        """Return the user's last response ID, or None if missing or expired."""
+        row = self._db.execute(
+            "SELECT response_id, ts FROM conversations WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    def set(self, user_id: int, response_id: str) -> None:
+        self._db.execute(
+            "INSERT INTO conversations (user_id, response_id, ts) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET response_id = excluded.response_id, ts = excluded.ts",
+            (user_id, response_id, int(time.time()))
+        )
+
+    def delete(self, user_id: int) -> bool:
+        """Forget the user's conversation. Returns True if one was stored."""
+        cursor = self._db.execute("DELETE FROM conversations WHERE user_id = ?", (user_id,))
+        return cursor.rowcount > 0
+
+    def prune(self) -> int:
+        """Delete expired conversations. Returns how many were removed."""
+        cursor = self._db.execute(
+            "DELETE FROM conversations WHERE ts < ?", (int(time.time()) - self.ttl,)
+        )
+        return cursor.rowcount
+
+
+class DynamoDBConversationStore:
+    """Map Telegram user IDs to their last OpenAI response ID in a DynamoDB table.
+
+    Unlike SQLite in /tmp, the table is shared by every Lambda container and
+    survives cold starts and deployments. Items carry an `expires_at` attribute
+    for DynamoDB's TTL cleanup; since that runs lazily, reads check it too.
+    Calls are blocking, which is fine on Lambda where a container handles one
+    update at a time.
+    """
+
+    # Written by every container, so reads must always go to the table
+    shared = True
+
+    def __init__(self, table_name: str, ttl: int):
+        # boto3 ships with the Lambda runtime; only needed when this store is used
+        import boto3
+        self.ttl = ttl
+        self._table = boto3.resource("dynamodb").Table(table_name)
+
+    def get(self, user_id: int) -> Optional[str]:
+        """Return the user's last response ID, or None if missing or expired."""
+        item = self._table.get_item(Key={"user_id": user_id}).get("Item")
+        if item is None or item["expires_at"] < time.time():
+            return None
+        return item["response_id"]
+
+    def set(self, user_id: int, response_id: str) -> None:
+        self._table.put_item(Item={
+            "user_id": user_id,
+            "response_id": response_id,
+            "expires_at": int(time.time()) + self.ttl
+        })
+
+    def delete(self, user_id: int) -> bool:
+        """Forget the user's conversation. Returns True if one was stored."""
+        response = self._table.delete_item(Key={"user_id": user_id}, ReturnValues="ALL_OLD")
+        return "Attributes" in response
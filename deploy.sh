@@ -21,6 +21,20 @@ echo "Deploying to AWS Lambda..."
 DEPLOY_OUTPUT=$(serverless deploy 2>&1)
 echo "$DEPLOY_OUTPUT"
 
+# Register the "/" command menu (only needed once per deploy, not per cold start)
+echo ""
+echo "Registering bot commands..."
+RESPONSE=$(curl -s -X POST "https://api.telegram.org/bot$TELEGRAM_BOT_TOKEN/setMyCommands" \
+    -H "Content-Type: application/json" --data @bot_commands.json)
+
+if echo "$RESPONSE" | grep -q '"ok":true'; then
+    echo "✅ Bot commands registered"
+else
+    # The menu is cosmetic; still point the webhook at the new deploy
+    echo "⚠️  Could not register bot commands, continuing"
+    echo "Response: $RESPONSE"
+fi
+
 # Extract webhook URL from deployment output
 WEBHOOK_URL=$(echo "$DEPLOY_OUTPUT" | grep -oE 'https://[a-zA-Z0-9-]+\.execute-api\.[a-zA-Z0-9-]+\.amazonaws\.com/[^/]+' | head -1)
 
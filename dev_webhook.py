@@ -2,6 +2,7 @@
 Automated local webhook development script.
 Handles ngrok, webhook setup, and server startup automatically.
 """
+import json
 import os
 import sys
 import httpx
@@ -16,6 +17,10 @@ if not BOT_TOKEN:
 
 NGROK_PORT = 8000
 
+# Command menu shown when users type "/" (setMyCommands body, shared with deploy.sh)
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot_commands.json")) as f:
+    BOT_COMMANDS = json.load(f)["commands"]
+
 
 def get_ngrok_url():
     """Get the ngrok public URL from the local API."""
@@ -50,6 +55,25 @@ def set_webhook(url):
         return False
 
 
+def set_commands():
+    """Register the bot's command menu with Telegram (deploy.sh does the same on deploy)."""
+    api_url = f"https://api.telegram.org/bot{BOT_TOKEN}/setMyCommands"
+    
+    try:
+        with httpx.Client(timeout=5) as client:
+            response = client.post(api_url, json={"commands": BOT_COMMANDS})
+            result = response.json()
+            if result.get("ok"):
+                print("✅ Bot commands registered")
+                return True
+            else:
+                print(f"❌ Failed to register commands: {result.get('description', 'Unknown error')}")
+                return False
+    except Exception as e:
+        print(f"❌ Error registering commands: {e}")
+        return False
+
+
 def main():
     print("🚀 Starting local webhook development environment...")
     print("")
@@ -72,6 +96,7 @@ def main():
     print("2️⃣ Setting Telegram webhook...")
     if not set_webhook(ngrok_url):
         sys.exit(1)
+    set_commands()
     print("")
     
     # Start server
@@ -1,94 +1,212 @@
 """
 AWS Lambda handler for Telegram bot webhook
 """
-import json
+import asyncio
+import base64
 import logging
+import os
 import sys
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Tuple
+import orjson
 from mangum import Mangum
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    handlers=[logging.StreamHandler(sys.stdout)]
-)
+# Set on Lambda, where updates are handed to an async invocation of this function
+LAMBDA_FUNCTION_NAME = os.getenv("AWS_LAMBDA_FUNCTION_NAME")
+
+if LAMBDA_FUNCTION_NAME:
+    # The runtime already gives the root logger a handler that stamps each line with
+    # the time and request ID (which also makes basicConfig a no-op); only the level
+    # needs raising
+    logging.getLogger().setLevel(logging.INFO)
+else:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# On Lambda, run on libuv when available
+# (uvicorn already prefers uvloop on its own in local development)
+if LAMBDA_FUNCTION_NAME:
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+    # One loop for the container's lifetime, shared with Mangum (which uses the
+    # current loop); the bot's HTTP clients stay bound to it between invocations
+    _LOOP = asyncio.new_event_loop()
+    asyncio.set_event_loop(_LOOP)
 
 
-@app.get("/health")
-def health():
-    """Health check endpoint"""
-    return {"status": "ok", "service": "telegram-chatbot"}
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    """Shut the bot down cleanly when running under a long-lived server"""
+    yield
+    # Mangum runs with lifespan="off", so this only happens locally (uvicorn)
+    if _initialized:
+        await bot_application.shutdown()
+        if bot_application.post_shutdown:
+            await bot_application.post_shutdown(bot_application)
+
 
-try:
-    from telegram import Update
-    from bot import create_application
-except Exception as e:
-    logger.error(f"Failed to import bot module: {e}", exc_info=True)
-    create_application = None
-    Update = None
+# Constant replies, serialized once instead of JSON-encoded per request
+_HEALTH_RESPONSE = Response(content=b'{"status":"ok","service":"telegram-chatbot"}',
+                            media_type="application/json")
+_OK_BODY = b'{"ok":true}'
+_OK_RESPONSE = Response(content=_OK_BODY, media_type="application/json")
+
+
+async def health(request: Request):
+    """Health check endpoint"""
+    return _HEALTH_RESPONSE
 
 # Store application instance (reused across invocations)
 bot_application = None
 _initialized = False
+# Bound once the application is initialized, for the per-update path
+_BOT = None
+_de_json = None
+_process = None
 
 
 async def get_application():
     """Get or create and initialize bot application (reused for warm starts)"""
-    global bot_application, _initialized
-    if create_application is None:
-        raise RuntimeError("Bot module not available")
+    global bot_application, _initialized, _BOT, _de_json, _process
     if bot_application is None:
+        # Imported on the first webhook rather than at module load, so /health on a
+        # cold local server doesn't wait for openai and telegram.ext to load
+        from bot import create_application
         bot_application = create_application()
     if not _initialized:
         await bot_application.initialize()
+        from telegram import Update  # Already loaded by create_application
+        _BOT = bot_application.bot
+        _de_json = Update.de_json
+        _process = bot_application.process_update
         _initialized = True
     return bot_application
 
 
-# Note: FastAPI startup events don't work reliably in Lambda
-# We initialize lazily on first request instead
+# Note: startup events don't work reliably in Lambda
+# Locally we initialize lazily on first request instead; on Lambda the application
+# is created and initialized during the init phase, on the container's loop
+if LAMBDA_FUNCTION_NAME:
+    try:
+        _LOOP.run_until_complete(get_application())
+    except Exception as e:
+        # Leave it to get_application, so the failure surfaces on the first update
+        logger.error("Failed to initialize bot application: %s", e, exc_info=True)
+
+# Updates being processed after their webhook returned (local server only);
+# the event loop only keeps weak references to tasks
+_background_tasks = set()
+
 
+async def process_update(body: dict) -> None:
+    """Run a Telegram update through the bot"""
+    # Once initialized, skip the get_application() coroutine altogether
+    if not _initialized:
+        await get_application()
+    await _process(_de_json(body, _BOT))
 
-@app.post("/webhook")
-async def webhook(request: Request):
-    """Handle Telegram webhook"""
+
+@lru_cache(maxsize=None)
+def _lambda_client():
+    # boto3 ships with the Lambda runtime
+    import boto3
+    return boto3.client("lambda")
+
+
+# A failing dependency fails every update the same way, so full tracebacks are
+# logged at most once per interval and repeats get a one-line summary
+TRACEBACK_INTERVAL = 60
+_last_traceback = float("-inf")
+
+
+def _log_error(message: str, e: BaseException) -> None:
+    global _last_traceback
+    now = time.monotonic()
+    if now - _last_traceback >= TRACEBACK_INTERVAL:
+        _last_traceback = now
+        logger.error("%s: %s", message, e, exc_info=e)
+    else:
+        logger.error("%s: %r", message, e)
+
+
+def _log_task_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        _log_error("Update processing failed", task.exception())
+
+
+def _accept_update(raw) -> Tuple[int, bytes]:
+    """Parse a webhook body and hand the update off for processing
+
+    Telegram only needs a 200 to stop redelivering, so the update is
+    acknowledged right away and the bot's reply is produced afterwards.
+    Returns the HTTP status and JSON body to reply with.
+    """
     try:
-        if create_application is None or Update is None:
-            return JSONResponse(
-                status_code=500,
-                content={"error": "Bot module not available"}
+        body = orjson.loads(raw)
+        if LAMBDA_FUNCTION_NAME:
+            # A Lambda container freezes as soon as it responds, which would stall
+            # a background task; an async self-invocation does the work instead
+            _lambda_client().invoke(
+                FunctionName=LAMBDA_FUNCTION_NAME,
+                InvocationType="Event",
+                Payload=orjson.dumps({"telegram_update": body})
             )
-        
-        body = await request.json()
-        application = await get_application()
-        update = Update.de_json(body, application.bot)
-        await application.process_update(update)
-        return {"ok": True}
+        else:
+            task = asyncio.create_task(process_update(body))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+            task.add_done_callback(_log_task_error)
+        return 200, _OK_BODY
+    except orjson.JSONDecodeError as e:
+        # Not a retryable server fault, so don't report it as one
+        logger.warning("Invalid webhook body: %s", e)
+        return 400, b'{"error":"Invalid JSON"}'
     except Exception as e:
-        logger.error(f"Webhook error: {e}", exc_info=True)
-        return JSONResponse(
-            status_code=500,
-            content={"error": str(e)}
-        )
+        _log_error("Webhook error", e)
+        return 500, orjson.dumps({"error": str(e)})
+
+
+async def webhook(request: Request):
+    """Handle Telegram webhook"""
+    status, content = _accept_update(await request.body())
+    if status == 200:
+        return _OK_RESPONSE
+    return Response(content=content, status_code=status, media_type="application/json")
+
+
+# A bare Starlette app: two routes don't need FastAPI's validation or OpenAPI layers
+app = Starlette(
+    routes=[
+        Route("/webhook", webhook, methods=["POST"]),
+        Route("/health", health, methods=["GET"])
+    ],
+    lifespan=lifespan
+)
 
 
 _mangum_handler = Mangum(app, lifespan="off")
 
 
 def _normalize_event(event):
-    """Normalize API Gateway event to ensure required fields exist for Mangum"""
-    # Make a copy to avoid modifying the original
-    normalized = event.copy()
-    
-    # Ensure requestContext exists and has required fields for API Gateway v2
-    if "requestContext" in normalized:
-        request_context = normalized["requestContext"]
-        if "http" in request_context:
-            http_context = request_context["http"]
+    """Fill in API Gateway fields Mangum requires, in place (each invocation gets its own event)"""
+    request_context = event.get("requestContext")
+    if request_context is not None:
+        http_context = request_context.get("http")
+        # Only API Gateway v2 events carry these fields
+        if http_context is not None:
             # Add missing sourceIp if not present (Mangum requires this)
             if "sourceIp" not in http_context:
                 http_context["sourceIp"] = "0.0.0.0"
@@ -97,26 +215,49 @@ def _normalize_event(event):
                 http_context["protocol"] = "HTTP/1.1"
     else:
         # Create minimal requestContext for API Gateway v2
-        normalized["requestContext"] = {
+        event["requestContext"] = {
             "http": {
-                "method": normalized.get("httpMethod", "GET"),
-                "path": normalized.get("path", normalized.get("rawPath", "/")),
+                "method": event.get("httpMethod", "GET"),
+                "path": event.get("path", event.get("rawPath", "/")),
                 "sourceIp": "0.0.0.0",
                 "protocol": "HTTP/1.1"
             }
         }
 
-    return normalized
+    return event
 
 def handler(event, context):
     """Main Lambda handler function"""
+    # Async invocation from the webhook: process the update here. Failures are left
+    # to the runtime, which logs them and counts them as errors (there are no retries)
+    if "telegram_update" in event:
+        _LOOP.run_until_complete(process_update(event["telegram_update"]))
+        return {"ok": True}
+
     try:
-        normalized_event = _normalize_event(event)
-        return _mangum_handler(normalized_event, context)
-    except Exception as e:
-        logger.error(f"Handler error: {e}", exc_info=True)
+        # Telegram's webhook POSTs skip Mangum and Starlette: all they need is the
+        # body handed off, which on Lambda is a synchronous invoke
+        # REST API (v1) events carry path/httpMethod, HTTP API (v2) ones rawPath/http.method
+        path = event.get("path") or event.get("rawPath")
+        method = event.get("httpMethod") or event.get("requestContext", {}).get("http", {}).get("method")
+        if path == "/webhook" and method == "POST":
+            body = event.get("body") or ""
+            if event.get("isBase64Encoded"):
+                body = base64.b64decode(body)
+            status, content = _accept_update(body)
+            return {
+                "statusCode": status,
+                "headers": {"Content-Type": "application/json"},
+                "body": content.decode()
+            }
+
+        return _mangum_handler(_normalize_event(event), context)
+    except (KeyError, ValueError) as e:
+        # Malformed event (e.g. a bad base64 body); anything else is a real fault
+        # and propagates to the runtime
+        logger.warning("Malformed event: %r", e)
         return {
-            "statusCode": 500,
+            "statusCode": 400,
             "headers": {"Content-Type": "application/json"},
-            "body": json.dumps({"error": str(e)})
+            "body": orjson.dumps({"error": str(e)}).decode()
         }
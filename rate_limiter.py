@@ -0,0 +1,90 @@
+"""
+Client-side token-bucket rate limiting for outbound API calls
+"""
+import asyncio
+import time
+from cachetools import TTLCache
+
+
+class TokenBucket:
+    """Token bucket that refills continuously up to its capacity."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        self._refill()
+        # A single request larger than the bucket can never fit - cap it
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class AsyncRateLimiter:
+    """Gate calls on both requests-per-minute and tokens-per-minute budgets."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm, rpm / 60)
+        self.tokens = TokenBucket(tpm, tpm / 60)
+        # Waiters queue on the lock so capacity is handed out in arrival order
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, est_tokens: int) -> None:
+        """Wait until one request and `est_tokens` tokens fit, then reserve them."""
+        async with self._lock:
+            while True:
+                delay = max(self.requests.wait_time(1), self.tokens.wait_time(est_tokens))
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self.requests.consume(1)
+            self.tokens.consume(est_tokens)
+
+
+class ChatRateLimiter:
+    """Pace outgoing messages per chat and across all chats (Telegram's flood limits)."""
+
+    def __init__(self, per_chat: float, overall: float, burst: int = 3, max_chats: int = 10000):
+        self.per_chat = per_chat
+        self.burst = burst
+        self.overall = TokenBucket(overall, overall)
+        # A chat's bucket is full again within seconds, so idle ones can be dropped
+        self._chats: TTLCache = TTLCache(maxsize=max_chats, ttl=60)
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.burst, self.per_chat)
+        return bucket
+
+    def _wait_time(self, chat_id: int) -> float:
+        return max(self._bucket(chat_id).wait_time(1), self.overall.wait_time(1))
+
+    def try_acquire(self, chat_id: int) -> bool:
+        """Reserve a send for the chat if one is available right now."""
+        if self._wait_time(chat_id) > 0:
+            return False
+        self._bucket(chat_id).consume(1)
+        self.overall.consume(1)
+        return True
+
+    async def acquire(self, chat_id: int) -> None:
+        """Wait until the chat may send another message, then reserve it."""
+        # Checking and consuming happen without an await in between, so no lock is
+        # needed, and a slow chat never holds up the others
+        while not self.try_acquire(chat_id):
+            await asyncio.sleep(self._wait_time(chat_id))
@@ -0,0 +1,88 @@
+"""
+Semantic response cache: reuse replies for prompts similar to ones already answered
+"""
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _quantize(vector: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Scale a vector into int8 so its largest component maps to +/-127."""
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    return np.round(vector / scale).astype(np.int8), scale
+
+
+class SemanticCache:
+    """Nearest-neighbour cache of prompt embedding -> (response ID, reply), persisted to SQLite.
+
+    Entries live in a fixed-size ring buffer; once full, the oldest entry is
+    overwritten. Embeddings are stored as int8 with a per-vector scale (4x less
+    memory than float32); at the similarity thresholds used here the
+    quantization error in cosine scores is well under 0.01. Lookups are a
+    brute-force cosine similarity over all entries. The response ID lets a
+    cache hit continue the conversation from the cached turn.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.9,
+                 max_entries: int = 1000, dim: int = 1536):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._vectors = np.zeros((max_entries, dim), dtype=np.int8)
+        self._scales = np.zeros(max_entries, dtype=np.float32)
+        self._responses: List[Optional[Tuple[str, str]]] = [None] * max_entries
+        self._count = 0
+        self._next = 0
+
+        self._db = sqlite3.connect(path)
+        # Entries in the older semantic_cache_int8 table have no response ID and are ignored
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_cache_entries "
+            "(slot INTEGER PRIMARY KEY, embedding BLOB NOT NULL, scale REAL NOT NULL, "
+            "response_id TEXT NOT NULL, response TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        rows = self._db.execute(
+            "SELECT slot, embedding, scale, response_id, response FROM semantic_cache_entries "
+            "WHERE slot < ? ORDER BY ts",
+            (max_entries,)
+        ).fetchall()
+        for slot, embedding, scale, response_id, response in rows:
+            self._vectors[slot] = np.frombuffer(embedding, dtype=np.int8)
+            self._scales[slot] = scale
+            self._responses[slot] = (response_id, response)
+            self._next = (slot + 1) % max_entries
+        self._count = len(rows)
+
+    def lookup(self, embedding: List[float]) -> Optional[Tuple[str, str]]:
+        """Return (response ID, reply) for the most similar prompt, if it is similar enough."""
+        if not self._count:
+            return None
+        query = _normalize(embedding)
+        scores = (self._vectors[:self._count] @ query) * self._scales[:self._count]
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            return self._responses[best]
+        return None
+
+    def add(self, embedding: List[float], response_id: str, response: str) -> None:
+        """Store a reply, overwriting the oldest entry once the cache is full."""
+        slot = self._next
+        vector, scale = _quantize(_normalize(embedding))
+        self._vectors[slot] = vector
+        self._scales[slot] = scale
+        self._responses[slot] = (response_id, response)
+        self._next = (slot + 1) % self.max_entries
+        self._count = min(self._count + 1, self.max_entries)
+
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO semantic_cache_entries "
+                "(slot, embedding, scale, response_id, response, ts) VALUES (?, ?, ?, ?, ?, ?)",
+                (slot, vector.tobytes(), scale, response_id, response, time.time())
+            )
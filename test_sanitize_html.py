@@ -0,0 +1,37 @@
+"""Tests for the Telegram HTML sanitizer (run with `python -m unittest`)."""
+
+import unittest
+
+from bot import sanitize_html
+
+
+class SanitizeHTMLTest(unittest.TestCase):
+    def test_valueless_allowed_attribute_is_kept(self):
+        self.assertEqual(sanitize_html("<blockquote expandable>quote</blockquote>"),
+                         "<blockquote expandable>quote</blockquote>")
+
+    def test_bare_words_are_not_markup(self):
+        self.assertEqual(sanitize_html("a<b and c>d"), "a&lt;b and c&gt;d")
+
+    def test_code_content_is_literal(self):
+        self.assertEqual(sanitize_html("<code>a<b</code>"), "<code>a&lt;b</code>")
+
+    def test_unclosed_code_is_closed(self):
+        self.assertEqual(sanitize_html("<code>if a<b"), "<code>if a&lt;b</code>")
+
+    def test_pre_code_keeps_language(self):
+        self.assertEqual(
+            sanitize_html('<pre><code class="language-python">x = 1 < 2</code></pre>'),
+            '<pre><code class="language-python">x = 1 &lt; 2</code></pre>'
+        )
+
+    def test_blocks_are_separated(self):
+        self.assertEqual(sanitize_html("<p>one</p><p>two</p>"), "one\n\ntwo")
+
+    def test_unsupported_attributes_are_dropped(self):
+        self.assertEqual(sanitize_html('<span class="tg-spoiler" onclick="x">s</span>'),
+                         '<span class="tg-spoiler">s</span>')
+
+
+if __name__ == "__main__":
+    unittest.main()